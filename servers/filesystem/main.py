@@ -1,18 +1,30 @@
-from fastapi import FastAPI, HTTPException, Body
-from fastapi.responses import PlainTextResponse
+from fastapi import FastAPI, HTTPException, Body, Query, Request
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 
 
 from pydantic import BaseModel, Field
+from diff_match_patch import diff_match_patch
+import orjson
 import os
 import pathlib
 import asyncio
-from typing import List, Optional, Literal, Dict, Union
+import base64
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Literal, Dict, Tuple, Union
 import difflib
+import fnmatch
 import shutil
-from datetime import datetime, timezone, timedelta
+import stat
+from datetime import datetime, timezone
+import heapq
 import json
+import mmap
+import re
+import time
 import secrets
+import sys
 from config import ALLOWED_DIRECTORIES
 
 app = FastAPI(
@@ -36,11 +48,26 @@ app.add_middleware(
 # ------------------------------------------------------------------------------
 
 
+class ORJSONResponse(JSONResponse):
+    """
+    JSON response rendered with orjson. Returned directly from endpoints with
+    potentially huge listings so FastAPI skips jsonable_encoder and the
+    stdlib json encoder for them.
+    """
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content)
+
+
+# Lowercased once at import; str.startswith accepts a tuple and checks all prefixes in C
+ALLOWED_DIRECTORIES_LOWER = tuple(allowed.lower() for allowed in ALLOWED_DIRECTORIES)
+ALLOWED_DIRECTORIES_PREFIXES = tuple(ALLOWED_DIRECTORIES)
+
+
 def normalize_path(requested_path: str) -> pathlib.Path:
     requested = pathlib.Path(os.path.expanduser(requested_path)).resolve()
-    for allowed in ALLOWED_DIRECTORIES:
-        if str(requested).lower().startswith(allowed.lower()): # Case-insensitive check
-            return requested
+    if str(requested).lower().startswith(ALLOWED_DIRECTORIES_LOWER): # Case-insensitive check
+        return requested
     raise HTTPException(
         status_code=403,
         detail={
@@ -52,6 +79,457 @@ def normalize_path(requested_path: str) -> pathlib.Path:
     )
 
 
+@lru_cache(maxsize=256)
+def compile_exclude_pattern(pattern: str) -> Tuple[bool, Tuple[re.Pattern, ...]]:
+    """
+    Compile a path glob into per-component regexes with pathlib.PurePath.match
+    semantics: relative patterns match the trailing components of a path,
+    absolute patterns must match the whole path. Cached across requests.
+    """
+    flags = re.IGNORECASE if os.name == "nt" else 0
+    pure = pathlib.PurePath(pattern)
+    parts = tuple(re.compile(fnmatch.translate(part), flags) for part in pure.parts)
+    return bool(pure.anchor), parts
+
+
+@lru_cache(maxsize=256)
+def compile_search_query(search_query: str) -> re.Pattern:
+    """Compile a case-insensitive literal bytes regex for a content search query."""
+    return re.compile(re.escape(search_query.encode()), re.IGNORECASE)
+
+
+def is_excluded(path_parts: Tuple[str, ...], compiled_excludes: List[Tuple[bool, Tuple[re.Pattern, ...]]]) -> bool:
+    """Checks the components of a path against compiled exclude patterns."""
+    for anchored, parts in compiled_excludes:
+        if anchored and len(parts) != len(path_parts):
+            continue
+        if len(parts) > len(path_parts):
+            continue
+        tail = path_parts[len(path_parts) - len(parts):]
+        if all(regex.match(component) for regex, component in zip(parts, tail)):
+            return True
+    return False
+
+
+def apply_edits(original: str, edits: List["EditOperation"]) -> str:
+    """
+    Apply edits top-to-bottom in a single forward pass.
+
+    Each oldText is located with str.find starting just after the previous
+    edit's match, and the result is stitched together with a single join
+    instead of re-copying the whole text for every edit. An edit whose
+    oldText does not occur after the previous edit is rejected with a 400.
+    """
+    pieces = []
+    cursor = 0
+    for edit in edits:
+        idx = original.find(edit.oldText, cursor)
+        if idx == -1:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Edit failed: oldText not found after the previous edit: '{edit.oldText[:50]}...'",
+            )
+        pieces.append(original[cursor:idx])
+        pieces.append(edit.newText)
+        cursor = idx + len(edit.oldText)
+    pieces.append(original[cursor:])
+    return "".join(pieces)
+
+
+DIFF_TIMEOUT_SECONDS = 1.0  # Upper bound on diff computation; past it the diff is less minimal
+DIFF_CONTEXT_LINES = 3
+
+
+def _diff_opcodes(a_count: int, b_count: int, diffs: List[Tuple[int, str]]) -> List[Tuple[str, int, int, int, int]]:
+    """Convert line-mode diff_match_patch diffs into difflib-style opcodes."""
+    opcodes = []
+    i = j = 0
+    for op, text in diffs:
+        n = len(text)  # Each character encodes one line
+        if op == diff_match_patch.DIFF_EQUAL:
+            opcodes.append(("equal", i, i + n, j, j + n))
+            i += n
+            j += n
+            continue
+        di, dj = (n, 0) if op == diff_match_patch.DIFF_DELETE else (0, n)
+        if opcodes and opcodes[-1][0] != "equal":
+            # Merge adjacent deletes/inserts so removed lines always print before added ones
+            _, i1, _, j1, _ = opcodes.pop()
+            opcodes.append(("replace", i1, i + di, j1, j + dj))
+        else:
+            opcodes.append(("delete" if di else "insert", i, i + di, j, j + dj))
+        i += di
+        j += dj
+    return opcodes or [("equal", 0, a_count, 0, b_count)]
+
+
+def _split_lines(text: str) -> List[str]:
+    """Split text into lines on \\n, keeping line endings (same boundaries the trimming uses)."""
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def _lines_to_chars(a: List[str], b: List[str]) -> Optional[Tuple[str, str]]:
+    """
+    Encode each distinct line as one character so diff_match_patch can diff
+    lines as text. Returns None once there are more distinct lines than
+    Unicode code points (0x110000); diff_linesToChars would instead silently
+    merge everything past its own cap into a single "line".
+    """
+    codes: Dict[str, str] = {}
+    encoded = []
+    for lines in (a, b):
+        chars = []
+        for line in lines:
+            code = codes.get(line)
+            if code is None:
+                if len(codes) > sys.maxunicode:
+                    return None
+                code = codes[line] = chr(len(codes))
+            chars.append(code)
+        encoded.append("".join(chars))
+    return encoded[0], encoded[1]
+
+
+def _group_opcodes(opcodes: List[Tuple[str, int, int, int, int]], n: int):
+    """Group opcodes into hunks with n lines of context (same as difflib's get_grouped_opcodes)."""
+    codes = list(opcodes)
+    if codes[0][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - n), i2, max(j1, j2 - n), j2
+    if codes[-1][0] == "equal":
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)
+
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == "equal" and i2 - i1 > n * 2:
+            group.append((tag, i1, min(i2, i1 + n), j1, min(j2, j1 + n)))
+            yield group
+            group = []
+            i1, j1 = max(i1, i2 - n), max(j1, j2 - n)
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == "equal"):
+        yield group
+
+
+def _format_range(start: int, stop: int) -> str:
+    beginning = start + 1  # Unified diff ranges are 1-based
+    length = stop - start
+    if length == 1:
+        return f"{beginning}"
+    if not length:
+        beginning -= 1  # Empty ranges begin at the line just before the range
+    return f"{beginning},{length}"
+
+
+def _trim_common_lines(dmp: diff_match_patch, original: str, modified: str, context: int) -> Tuple[int, int]:
+    """
+    Find the unchanged head and tail shared by both texts, snapped to whole lines
+    and shrunk by `context` lines on each side so hunks keep their context.
+
+    Returns (prefix_len, suffix_len) in characters; both texts share
+    original[:prefix_len] and original[len(original) - suffix_len:].
+    """
+    prefix = dmp.diff_commonPrefix(original, modified)
+    prefix = original.rfind("\n", 0, prefix) + 1  # Back to the start of the first differing line
+    suffix = dmp.diff_commonSuffix(original[prefix:], modified[prefix:])
+    # Forward to a line start whose preceding newline is itself shared by both texts
+    newline = original.find("\n", len(original) - suffix) if suffix else -1
+    tail_start = len(original) if newline == -1 else newline + 1
+
+    for _ in range(context):
+        if prefix == 0:
+            break
+        prefix = original.rfind("\n", 0, prefix - 1) + 1
+    for _ in range(context):
+        if tail_start >= len(original):
+            break
+        newline = original.find("\n", tail_start)
+        tail_start = len(original) if newline == -1 else newline + 1
+    return prefix, len(original) - tail_start
+
+
+def unified_diff(original: str, modified: str, fromfile: str, tofile: str) -> str:
+    """
+    Produce a unified diff between two texts.
+
+    Lines are diffed with diff_match_patch (Myers' algorithm with a time
+    budget) instead of difflib, which degrades badly on large inputs; difflib
+    is only used when there are too many distinct lines to encode. The
+    common head and tail of the texts are trimmed first, so a small edit to a
+    large file only diffs the lines around the change.
+    """
+    if original == modified:
+        return ""
+    dmp = diff_match_patch()
+    dmp.Diff_Timeout = DIFF_TIMEOUT_SECONDS
+    prefix, suffix = _trim_common_lines(dmp, original, modified, DIFF_CONTEXT_LINES)
+    line_offset = original.count("\n", 0, prefix)  # Lines removed ahead of every hunk
+    original = original[prefix:len(original) - suffix]
+    modified = modified[prefix:len(modified) - suffix]
+
+    a = _split_lines(original)
+    b = _split_lines(modified)
+    encoded = _lines_to_chars(a, b)
+    if encoded is None:
+        # Too many distinct lines to encode; difflib is slow here but correct
+        opcodes = difflib.SequenceMatcher(None, a, b).get_opcodes()
+    else:
+        opcodes = _diff_opcodes(len(a), len(b), dmp.diff_main(encoded[0], encoded[1], False))
+
+    output = []
+    for group in _group_opcodes(opcodes, DIFF_CONTEXT_LINES):
+        if not output:
+            output.append(f"--- {fromfile}\n")
+            output.append(f"+++ {tofile}\n")
+        first, last = group[0], group[-1]
+        output.append(
+            f"@@ -{_format_range(first[1] + line_offset, last[2] + line_offset)}"
+            f" +{_format_range(first[3] + line_offset, last[4] + line_offset)} @@\n"
+        )
+        for tag, i1, i2, j1, j2 in group:
+            if tag == "equal":
+                output.extend(" " + line for line in a[i1:i2])
+                continue
+            output.extend("-" + line for line in a[i1:i2])
+            output.extend("+" + line for line in b[j1:j2])
+    return "".join(output)
+
+
+STREAM_CHUNK_SIZE = 1 << 20  # 1 MiB per read when streaming subprocess output
+
+LINE_COUNT_CHUNK_SIZE = 1 << 20  # Bounds the copy made while counting line breaks in an mmap
+
+# Non-ASCII characters whose str.lower() contains ASCII: KELVIN SIGN -> "k" and
+# LATIN CAPITAL LETTER I WITH DOT ABOVE -> "i" + combining dot. A bytes regex
+# can't see these, so files containing them are searched as text.
+_ASCII_LOWERING_CHARS = {"k": "\u212a".encode(), "i": "\u0130".encode()}
+
+
+def _count_line_breaks(mm: mmap.mmap, start: int, end: int, has_cr: bool) -> int:
+    """Count universal-newline line breaks (\\n, \\r, \\r\\n) in mm[start:end], chunk by chunk."""
+    count = 0
+    for offset in range(start, end, LINE_COUNT_CHUNK_SIZE):
+        chunk = mm[offset:min(end, offset + LINE_COUNT_CHUNK_SIZE)]
+        count += chunk.count(b"\n")
+        if has_cr:
+            count += chunk.count(b"\r") - chunk.count(b"\r\n")
+            # A \r\n split across two chunks was counted twice
+            if offset > start and chunk[:1] == b"\n" and mm[offset - 1] == ord("\r"):
+                count -= 1
+    return count
+
+
+def _search_file_text(item_path: pathlib.Path, search_query: str) -> List[Dict]:
+    """Line-by-line text scan; the reference behaviour the mmap scan reproduces."""
+    matches = []
+    file_path = str(item_path)
+    search_query_lower = search_query.lower()
+    with item_path.open("r", encoding="utf-8", errors="ignore") as f:
+        for line_num, line in enumerate(f, 1):
+            if search_query_lower in line.lower():
+                matches.append(
+                    {"file_path": file_path, "line_number": line_num, "line_content": line.strip()}
+                )
+    return matches
+
+
+def search_file_content(item_path: pathlib.Path, search_query: str) -> List[Dict]:
+    """
+    Return one match per line of item_path containing search_query (case-insensitive).
+
+    ASCII queries are matched with a compiled bytes regex over an mmap of the file,
+    so the scan runs in C instead of decoding and lowercasing every line in Python.
+    Lines are split on \\n, \\r and \\r\\n like a text-mode read. Queries that are
+    non-ASCII or contain line breaks, and files with characters that lowercase
+    to ASCII, fall back to the line-by-line text scan.
+    """
+    if not search_query.isascii() or "\n" in search_query or "\r" in search_query:
+        return _search_file_text(item_path, search_query)
+
+    matches = []
+    file_path = str(item_path)
+    pattern = compile_search_query(search_query)
+    query_lower = search_query.lower()
+    with item_path.open("rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return matches  # mmap cannot map empty files
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            if any(c in query_lower and mm.find(seq) != -1 for c, seq in _ASCII_LOWERING_CHARS.items()):
+                return _search_file_text(item_path, search_query)
+
+            size = len(mm)
+            has_cr = mm.find(b"\r") != -1
+            line_num = 1
+            counted_to = 0
+            pos = 0
+            while pos <= size:
+                m = pattern.search(mm, pos)
+                if m is None or m.start() >= size:
+                    break
+                start = m.start()
+                line_num += _count_line_breaks(mm, counted_to, start, has_cr)
+                line_start = mm.rfind(b"\n", 0, start) + 1
+                line_end = mm.find(b"\n", m.end())
+                if line_end == -1:
+                    line_end = size
+                if has_cr:
+                    line_start = max(line_start, mm.rfind(b"\r", 0, start) + 1)
+                    cr = mm.find(b"\r", m.end(), line_end)
+                    if cr != -1:
+                        line_end = cr
+                matches.append(
+                    {
+                        "file_path": file_path,
+                        "line_number": line_num,
+                        "line_content": mm[line_start:line_end].decode("utf-8", errors="ignore").strip(),
+                    }
+                )
+                # Only report each line once; resume scanning after its line break
+                counted_to = start
+                pos = line_end + (2 if mm[line_end:line_end + 2] == b"\r\n" else 1)
+    return matches
+
+
+# Shared pool for blocking search work; oversubscribed relative to cores since
+# most of the time is spent waiting on the filesystem.
+SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=(os.cpu_count() or 1) * 4, thread_name_prefix="search")
+SEARCH_CONCURRENCY = 32  # Max files scanned at once per request
+
+
+def scan_search_target(item_path: pathlib.Path, search_query: str) -> List[Dict]:
+    """Runs search_file_content() on a glob result, skipping non-files and unreadable files."""
+    if not item_path.is_file():
+        return []
+    try:
+        return search_file_content(item_path, search_query)
+    except Exception as e:
+        # Log or handle files that cannot be read (e.g., permission errors, binary files)
+        print(f"Could not read or search file {item_path}: {e}")
+        return []
+
+
+RIPGREP_PATH = shutil.which("rg")  # Optional: delegate content search to ripgrep when installed
+
+
+async def ripgrep_search(
+    base_path: pathlib.Path, search_query: str, file_pattern: str, recursive: bool
+) -> Optional[List[Dict]]:
+    """
+    Search file contents with ripgrep, returning matches in the same shape as
+    search_file_content(). Returns None if ripgrep is unavailable or cannot be
+    used for this request, so the caller can fall back to the Python scan.
+    """
+    # ripgrep globs containing a separator are anchored differently from pathlib's glob
+    if RIPGREP_PATH is None or "/" in file_pattern:
+        return None
+
+    args = [
+        RIPGREP_PATH,
+        "--json",
+        "--no-config",
+        "--fixed-strings",
+        "--ignore-case",
+        "--no-ignore",  # Search everything pathlib's glob would, regardless of .gitignore
+        "--hidden",
+        "--text",
+        "--no-messages",
+        "--follow",  # pathlib's glob returns symlinked files; see via_symlinked_dir below
+        "--glob",
+        file_pattern,
+    ]
+    if not recursive:
+        args += ["--max-depth", "1"]
+    args += ["--", search_query, str(base_path)]
+
+    try:
+        proc = await asyncio.create_subprocess_exec(
+            *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.DEVNULL
+        )
+    except OSError as e:
+        print(f"Could not run ripgrep, falling back to Python search: {e}")
+        return None
+
+    matches = []
+
+    def parse_event(raw_line: bytes):
+        event = json.loads(raw_line)
+        if event["type"] != "match":
+            return
+        match_data = event["data"]
+        lines = match_data["lines"]
+        if "text" in lines:
+            line_content = lines["text"]
+        else:
+            line_content = base64.b64decode(lines["bytes"]).decode("utf-8", errors="ignore")
+        file_path = match_data["path"].get("text")
+        if file_path is None:
+            file_path = base64.b64decode(match_data["path"]["bytes"]).decode("utf-8", errors="ignore")
+        matches.append(
+            {
+                "file_path": file_path,
+                "line_number": match_data["line_number"],
+                "line_content": line_content.strip(),
+            }
+        )
+
+    try:
+        # Read in chunks rather than with readline(): a single JSON event (e.g. a
+        # match in minified JS) can exceed the StreamReader's line length limit.
+        buffer = bytearray()
+        while chunk := await proc.stdout.read(STREAM_CHUNK_SIZE):
+            buffer.extend(chunk)
+            last_newline = chunk.rfind(b"\n")
+            if last_newline == -1:
+                continue
+            end = len(buffer) - len(chunk) + last_newline
+            for raw_line in bytes(buffer[:end]).split(b"\n"):
+                if raw_line:
+                    parse_event(raw_line)
+            del buffer[:end + 1]
+        if buffer.strip():
+            parse_event(bytes(buffer))
+        returncode = await proc.wait()
+    finally:
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+
+    # Exit code 1 means no matches. 2 means an error: with partial results some
+    # files could not be read (the Python scan skips those too); with none, rg
+    # could not run the search at all (e.g. an invalid glob), so fall back.
+    if returncode not in (0, 1) and (returncode != 2 or not matches):
+        return None
+
+    # --follow also descends into symlinked directories, which pathlib's glob
+    # does not; drop matches found through one.
+    base = str(base_path)
+    symlinked_dirs: Dict[str, bool] = {}
+
+    def via_symlinked_dir(file_path: str) -> bool:
+        parent = os.path.dirname(file_path)
+        while len(parent) > len(base):
+            if parent not in symlinked_dirs:
+                symlinked_dirs[parent] = os.path.islink(parent)
+            if symlinked_dirs[parent]:
+                return True
+            parent = os.path.dirname(parent)
+        return False
+
+    matches = await asyncio.to_thread(
+        lambda: [match for match in matches if not via_symlinked_dir(match["file_path"])]
+    )
+
+    # rg searches files in parallel, so its output order varies between runs;
+    # sort the same way as the Python scan orders its candidates
+    matches.sort(key=lambda match: (match["file_path"], match["line_number"]))
+    return matches
+
+
 # ------------------------------------------------------------------------------
 # Pydantic Schemas
 # ------------------------------------------------------------------------------
@@ -70,14 +548,18 @@ class WriteFileRequest(BaseModel):
 
 class EditOperation(BaseModel):
     oldText: str = Field(
-        ..., description="Text to find and replace (exact match required)"
+        ...,
+        description="Text to find and replace (exact match required). Replaces the first occurrence after the previous edit's match.",
     )
     newText: str = Field(..., description="Replacement text")
 
 
 class EditFileRequest(BaseModel):
     path: str = Field(..., description="Path to the file to edit.")
-    edits: List[EditOperation] = Field(..., description="List of edits to apply.")
+    edits: List[EditOperation] = Field(
+        ...,
+        description="List of edits to apply, in the order their oldText appears in the file. Each edit matches the original content, not the output of earlier edits.",
+    )
     dryRun: bool = Field(
         False, description="If true, only return diff without modifying file."
     )
@@ -144,7 +626,7 @@ class GetMetadataRequest(BaseModel):
 # Global state for pending confirmations
 # ------------------------------------------------------------------------------
 
-# --- Confirmation Token State Management (using a file) ---
+# --- Confirmation Token State Management (in memory, persisted to a file) ---
 CONFIRMATION_FILE = pathlib.Path("./.pending_confirmations.json")
 CONFIRMATION_TTL_SECONDS = 60 # Token validity period
 
@@ -155,14 +637,14 @@ def load_confirmations() -> Dict[str, Dict]:
     try:
         with CONFIRMATION_FILE.open("r") as f:
             data = json.load(f)
-            # Convert expiry string back to datetime object
-            now = datetime.now(timezone.utc)
+            # Expiry is stored as a POSIX timestamp (float seconds, UTC)
+            now_ts = time.time()
             valid_confirmations = {}
             for token, details in data.items():
                 try:
-                    details["expiry"] = datetime.fromisoformat(details["expiry"])
+                    details["expiry"] = float(details["expiry"])
                     # Clean up expired tokens during load
-                    if details["expiry"] > now:
+                    if details["expiry"] > now_ts:
                          valid_confirmations[token] = details
                 except (ValueError, TypeError, KeyError):
                      print(f"Warning: Skipping invalid confirmation data for token {token}")
@@ -173,28 +655,53 @@ def load_confirmations() -> Dict[str, Dict]:
         return {}
 
 def save_confirmations(confirmations: Dict[str, Dict]):
-    """Saves pending confirmations to the JSON file."""
+    """Atomically saves pending confirmations to the JSON file."""
     try:
-        # Convert datetime objects to ISO strings for JSON serialization
-        serializable_confirmations = {}
-        for token, details in confirmations.items():
-             serializable_details = details.copy()
-             serializable_details["expiry"] = details["expiry"].isoformat()
-             serializable_confirmations[token] = serializable_details
-
-        with CONFIRMATION_FILE.open("w") as f:
-            json.dump(serializable_confirmations, f, indent=2)
+        # Write to a sibling temp file and swap it in so readers never see a partial file
+        tmp_file = CONFIRMATION_FILE.with_name(f"{CONFIRMATION_FILE.name}.{os.getpid()}.tmp")
+        with tmp_file.open("w") as f:
+            json.dump(confirmations, f, indent=2)
+        os.replace(tmp_file, CONFIRMATION_FILE)
     except IOError as e:
         print(f"Error saving confirmations file: {e}")
 
-# Clean up the file on startup if it exists from a previous run
-if CONFIRMATION_FILE.exists():
-    # print("Cleaning up stale confirmation file on startup.")
-    try:
-        CONFIRMATION_FILE.unlink()
-    except OSError as e:
-        # print(f"Warning: Could not delete stale confirmation file: {e}") # Removed print
-        pass # Silently ignore if cleanup fails, not critical
+# Pending confirmations live in process memory; the file is only a write-behind
+# copy, so its staleness is bounded by CONFIRMATION_TTL_SECONDS.
+PENDING_CONFIRMATIONS: Dict[str, Dict] = load_confirmations()
+# Min-heap of (expiry_timestamp, token) so expired tokens are swept in amortized O(log n)
+EXPIRY_HEAP: List[Tuple[float, str]] = [
+    (details["expiry"], token) for token, details in PENDING_CONFIRMATIONS.items()
+]
+heapq.heapify(EXPIRY_HEAP)
+CONFIRMATION_LOCK = asyncio.Lock()
+_persist_lock = asyncio.Lock() # Serializes saves so the newest snapshot is written last
+_persist_tasks = set() # Strong references so background saves are not garbage collected
+
+async def _persist():
+    async with _persist_lock:
+        snapshot = dict(PENDING_CONFIRMATIONS)
+        await asyncio.to_thread(save_confirmations, snapshot)
+
+def expire_confirmations(now_ts: float) -> bool:
+    """Drops every pending confirmation whose expiry is at or before now_ts.
+
+    Returns True if any token was removed. Heap entries for tokens that were
+    already consumed are simply discarded.
+    """
+    removed = False
+    while EXPIRY_HEAP and EXPIRY_HEAP[0][0] <= now_ts:
+        expiry, token = heapq.heappop(EXPIRY_HEAP)
+        details = PENDING_CONFIRMATIONS.get(token)
+        if details is not None and details["expiry"] == expiry:
+            del PENDING_CONFIRMATIONS[token]
+            removed = True
+    return removed
+
+def persist_confirmations():
+    """Schedules a background save of the current pending confirmations."""
+    task = asyncio.create_task(_persist())
+    _persist_tasks.add(task)
+    task.add_done_callback(_persist_tasks.discard)
 
 # ------------------------------------------------------------------------------
 # Routes
@@ -226,7 +733,7 @@ async def read_file(data: ReadFileRequest = Body(...)):
     """
     path = normalize_path(data.path)
     try:
-        file_content = path.read_text(encoding="utf-8")
+        file_content = await asyncio.to_thread(path.read_text, encoding="utf-8")
         return ReadFileResponse(content=file_content) # Return Pydantic model instance
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"File not found: {data.path}")
@@ -237,6 +744,27 @@ async def read_file(data: ReadFileRequest = Body(...)):
         raise HTTPException(status_code=500, detail=f"Failed to read file {data.path}: {str(e)}")
 
 
+@app.post("/read_file_stream", response_class=FileResponse, summary="Stream a file's raw bytes")
+async def read_file_stream(data: ReadFileRequest = Body(...)):
+    """
+    Stream the raw contents of a file without decoding or JSON wrapping.
+    Intended for large files; the body is sent straight from the file
+    (via sendfile where supported) instead of being loaded into memory.
+    """
+    path = normalize_path(data.path)
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"File not found: {data.path}")
+    except PermissionError:
+        raise HTTPException(status_code=403, detail=f"Permission denied for file: {data.path}")
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise HTTPException(status_code=404, detail=f"File not found: {data.path}")
+    if not os.access(path, os.R_OK):
+        raise HTTPException(status_code=403, detail=f"Permission denied for file: {data.path}")
+    return FileResponse(path, media_type="application/octet-stream", stat_result=stat_result)
+
+
 @app.post("/write_file", response_model=SuccessResponse, summary="Write to a file")
 async def write_file(data: WriteFileRequest = Body(...)):
     """
@@ -244,13 +772,47 @@ async def write_file(data: WriteFileRequest = Body(...)):
     """
     path = normalize_path(data.path)
     try:
-        path.write_text(data.content, encoding="utf-8")
+        await asyncio.to_thread(path.write_text, data.content, encoding="utf-8")
         return SuccessResponse(message=f"Successfully wrote to {data.path}")
     except PermissionError:
         raise HTTPException(status_code=403, detail=f"Permission denied to write to {data.path}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to write to {data.path}: {str(e)}")
 
+@app.post("/write_file_stream", response_model=SuccessResponse, summary="Stream raw bytes to a file")
+async def write_file_stream(
+    request: Request,
+    path: str = Query(..., description="Path to write to. Existing file will be overwritten."),
+):
+    """
+    Write the raw request body to a file chunk by chunk, overwriting if it exists.
+    Intended for large uploads that should not be buffered in memory.
+    """
+    file_path = normalize_path(path)
+    # Stream into a sibling temp file and only swap it in once the whole body
+    # arrived, so a disconnect or error mid-upload leaves the target untouched
+    temp_path = file_path.with_name(f".{file_path.name}.{secrets.token_hex(8)}.tmp")
+    try:
+        fd = await asyncio.to_thread(os.open, temp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in request.stream():
+                    if chunk:
+                        await asyncio.to_thread(f.write, chunk)
+            try:
+                await asyncio.to_thread(shutil.copymode, file_path, temp_path)
+            except FileNotFoundError:
+                pass
+            await asyncio.to_thread(os.replace, temp_path, file_path)
+        except BaseException:
+            await asyncio.to_thread(temp_path.unlink, missing_ok=True)
+            raise
+        return SuccessResponse(message=f"Successfully wrote to {path}")
+    except PermissionError:
+        raise HTTPException(status_code=403, detail=f"Permission denied to write to {path}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to write to {path}: {str(e)}")
+
 @app.post(
     "/edit_file",
     response_model=Union[SuccessResponse, DiffResponse], # Use Union for multiple response types
@@ -263,7 +825,7 @@ async def edit_file(data: EditFileRequest = Body(...)):
     """
     path = normalize_path(data.path)
     try:
-        original = path.read_text(encoding="utf-8")
+        original = await asyncio.to_thread(path.read_text, encoding="utf-8")
     except FileNotFoundError:
         raise HTTPException(status_code=404, detail=f"File not found: {data.path}")
     except PermissionError:
@@ -271,27 +833,20 @@ async def edit_file(data: EditFileRequest = Body(...)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to read file {data.path} for editing: {str(e)}")
 
-    modified = original
-    try:
-        for edit in data.edits:
-            if edit.oldText not in modified:
-                raise HTTPException(
-                    status_code=400,
-                    detail=f"Edit failed: oldText not found in content: '{edit.oldText[:50]}...'",
-                )
-            modified = modified.replace(edit.oldText, edit.newText, 1)
+    modified = apply_edits(original, data.edits)
 
+    try:
         if data.dryRun:
-            diff_output = difflib.unified_diff(
-                original.splitlines(keepends=True),
-                modified.splitlines(keepends=True),
+            diff_output = unified_diff(
+                original,
+                modified,
                 fromfile=f"a/{data.path}",
                 tofile=f"b/{data.path}",
             )
-            return DiffResponse(diff="".join(diff_output)) # Return JSON diff
+            return DiffResponse(diff=diff_output) # Return JSON diff
 
         # Write changes if not dry run
-        path.write_text(modified, encoding="utf-8")
+        await asyncio.to_thread(path.write_text, modified, encoding="utf-8")
         return SuccessResponse(message=f"Successfully edited file {data.path}") # Return JSON success
 
     except PermissionError:
@@ -329,35 +884,48 @@ async def list_directory(data: ListDirectoryRequest = Body(...)):
     if not dir_path.is_dir():
         raise HTTPException(status_code=400, detail="Provided path is not a directory")
 
-    listing = []
-    for entry in dir_path.iterdir():
-        entry_type = "directory" if entry.is_dir() else "file"
-        listing.append({"name": entry.name, "type": entry_type})
+    with os.scandir(dir_path) as it:
+        listing = [
+            {"name": entry.name, "type": "directory" if entry.is_dir() else "file"}
+            for entry in it
+        ]
 
-    # Return the list directly, FastAPI will serialize it to JSON
-    return listing
+    return ORJSONResponse(listing)
 
 
 @app.post("/directory_tree", summary="Recursive directory tree")
 async def directory_tree(data: DirectoryTreeRequest = Body(...)):
     """
     Recursively return a tree structure of a directory.
+    Every directory entry has a "children" list; symlinked directories are
+    not descended into, so theirs is always empty.
     """
     base_path = normalize_path(data.path)
 
-    def build_tree(current: pathlib.Path):
-        entries = []
-        for item in current.iterdir():
-            entry = {
-                "name": item.name,
-                "type": "directory" if item.is_dir() else "file",
-            }
-            if item.is_dir():
-                entry["children"] = build_tree(item)
-            entries.append(entry)
-        return entries
-
-    return build_tree(base_path)
+    def build_tree(root: str) -> List[Dict]:
+        # Iterative walk with an explicit stack so deep trees can't hit the
+        # recursion limit; DirEntry caches the type from the directory read.
+        tree = []
+        stack = [(root, tree)]
+        while stack:
+            current, entries = stack.pop()
+            with os.scandir(current) as it:
+                for item in it:
+                    is_dir = item.is_dir()
+                    entry = {
+                        "name": item.name,
+                        "type": "directory" if is_dir else "file",
+                    }
+                    if is_dir:
+                        entry["children"] = []
+                        # Symlinked directories are listed but not descended into,
+                        # which also keeps symlink loops from recursing forever
+                        if not item.is_symlink():
+                            stack.append((item.path, entry["children"]))
+                    entries.append(entry)
+        return tree
+
+    return ORJSONResponse(build_tree(str(base_path)))
 
 
 @app.post("/search_files", summary="Search for files")
@@ -366,25 +934,52 @@ async def search_files(data: SearchFilesRequest = Body(...)):
     Search files and directories matching a pattern.
     """
     base_path = normalize_path(data.path)
-    results = []
-
-    for root, dirs, files in os.walk(base_path):
-        root_path = pathlib.Path(root)
-        # Apply exclusion patterns
-        excluded = False
-        for pattern in data.excludePatterns:
-            if pathlib.Path(root).match(pattern):
-                excluded = True
-                break
-        if excluded:
-            continue
-        for item in files + dirs:
-            if data.pattern.lower() in item.lower():
-                result_path = root_path / item
-                if any(str(result_path).startswith(alt) for alt in ALLOWED_DIRECTORIES):
-                    results.append(str(result_path))
-
-    return {"matches": results or ["No matches found"]}
+    pattern_lower = data.pattern.lower()
+    compiled_excludes = [compile_exclude_pattern(p) for p in data.excludePatterns or []]
+
+    def walk_matching() -> List[str]:
+        results = []
+        # Every result path extends base_path, so one prefix check on the base
+        # is equivalent to checking each match against the allowed directories.
+        if is_excluded(base_path.parts, compiled_excludes) or not str(base_path).startswith(ALLOWED_DIRECTORIES_PREFIXES):
+            return results
+
+        # Depth-first scandir walk in the same order as os.walk (files, then
+        # directories, then each subdirectory); excluded directories are pruned
+        # before they are ever opened.
+        stack = [(str(base_path), base_path.parts)]
+        while stack:
+            root, root_parts = stack.pop()
+            files, dirs = [], []
+            try:
+                with os.scandir(root) as it:
+                    for entry in it:
+                        try:
+                            is_dir = entry.is_dir()
+                        except OSError:
+                            is_dir = False
+                        (dirs if is_dir else files).append(entry)
+            except OSError:
+                continue  # Unreadable directories are skipped, as os.walk does
+
+            results.extend(entry.path for entry in files if pattern_lower in entry.name.lower())
+            results.extend(entry.path for entry in dirs if pattern_lower in entry.name.lower())
+
+            subdirs = []
+            for entry in dirs:
+                if entry.is_symlink():
+                    continue
+                entry_parts = root_parts + (entry.name,)
+                if not is_excluded(entry_parts, compiled_excludes):
+                    subdirs.append((entry.path, entry_parts))
+            stack.extend(reversed(subdirs))
+        return results
+
+    # The walk is blocking, so run it in the search pool to keep the event loop free
+    loop = asyncio.get_running_loop()
+    results = await loop.run_in_executor(SEARCH_EXECUTOR, walk_matching)
+
+    return ORJSONResponse({"matches": results or ["No matches found"]})
 
 
 @app.post(
@@ -402,46 +997,46 @@ async def delete_path(data: DeletePathRequest = Body(...)):
 
     Use 'recursive=True' to delete non-empty directories.
     """
-    pending_confirmations = load_confirmations() # Load state from file
     path = normalize_path(data.path)
-    now = datetime.now(timezone.utc)
+    now_ts = time.time()
 
     # --- Step 2: Confirmation Request ---
     if data.confirmation_token:
-        # print(f"Attempting confirmation with token: {data.confirmation_token}") # Removed print
-        if data.confirmation_token not in pending_confirmations:
-            # print(f"Error: Token '{data.confirmation_token}' not found in pending_confirmations.") # Removed print
-            raise HTTPException(status_code=400, detail="Invalid or expired confirmation token.")
-
-        confirmation_data = pending_confirmations[data.confirmation_token]
-
-        # Validate token expiry
-        if now > confirmation_data["expiry"]:
-            del pending_confirmations[data.confirmation_token] # Clean up expired token
-            save_confirmations(pending_confirmations) # Save updated state
-            raise HTTPException(status_code=400, detail="Confirmation token has expired.")
-
-        # Validate request parameters match
-        if confirmation_data["path"] != data.path or confirmation_data["recursive"] != data.recursive:
-            raise HTTPException(
-                status_code=400,
-                detail="Request parameters (path, recursive) do not match the original request for this token."
-            )
+        async with CONFIRMATION_LOCK:
+            confirmation_data = PENDING_CONFIRMATIONS.get(data.confirmation_token)
+            if confirmation_data is None:
+                if expire_confirmations(now_ts):
+                    persist_confirmations()
+                raise HTTPException(status_code=400, detail="Invalid or expired confirmation token.")
+
+            # Validate token expiry
+            if now_ts > confirmation_data["expiry"]:
+                expire_confirmations(now_ts)
+                PENDING_CONFIRMATIONS.pop(data.confirmation_token, None)
+                persist_confirmations()
+                raise HTTPException(status_code=400, detail="Confirmation token has expired.")
+
+            # Validate request parameters match
+            if confirmation_data["path"] != data.path or confirmation_data["recursive"] != data.recursive:
+                raise HTTPException(
+                    status_code=400,
+                    detail="Request parameters (path, recursive) do not match the original request for this token."
+                )
 
-        # --- Parameters match and token is valid: Proceed with deletion ---
-        del pending_confirmations[data.confirmation_token] # Consume the token
-        save_confirmations(pending_confirmations) # Save updated state
+            # --- Parameters match and token is valid: Proceed with deletion ---
+            del PENDING_CONFIRMATIONS[data.confirmation_token] # Consume the token
+            expire_confirmations(now_ts)
+            persist_confirmations()
 
         try:
-            if not path.exists():
-                # Path might have been deleted between requests, treat as success or specific error?
-                # For now, raise 404 as it doesn't exist *now*.
-                raise HTTPException(status_code=404, detail=f"Path not found: {data.path}")
+            # A single lstat gives both existence and type. If the path was deleted
+            # between requests it raises FileNotFoundError, reported as 404.
+            mode = os.lstat(path).st_mode
 
-            if path.is_file():
+            if stat.S_ISREG(mode):
                 path.unlink()
                 return SuccessResponse(message=f"Successfully deleted file: {data.path}")
-            elif path.is_dir():
+            elif stat.S_ISDIR(mode):
                 if data.recursive:
                     shutil.rmtree(path)
                     return SuccessResponse(message=f"Successfully deleted directory recursively: {data.path}")
@@ -457,6 +1052,10 @@ async def delete_path(data: DeletePathRequest = Body(...)):
             else:
                 raise HTTPException(status_code=400, detail=f"Path is not a file or directory: {data.path}")
 
+        except HTTPException:
+            raise
+        except FileNotFoundError:
+            raise HTTPException(status_code=404, detail=f"Path not found: {data.path}")
         except PermissionError:
             raise HTTPException(status_code=403, detail=f"Permission denied to delete {data.path}")
         except Exception as e:
@@ -468,17 +1067,22 @@ async def delete_path(data: DeletePathRequest = Body(...)):
         if not path.exists():
              raise HTTPException(status_code=404, detail=f"Path not found: {data.path}")
 
-        # Generate token and expiry
-        token = secrets.token_hex(3)[:5] # Generate 6 hex chars (3 bytes), take first 5
-        expiry_time = now + timedelta(seconds=CONFIRMATION_TTL_SECONDS)
+        expiry_ts = now_ts + CONFIRMATION_TTL_SECONDS
 
         # Store confirmation details
-        pending_confirmations[token] = {
-            "path": data.path,
-            "recursive": data.recursive,
-            "expiry": expiry_time,
-        }
-        save_confirmations(pending_confirmations) # Save updated state
+        async with CONFIRMATION_LOCK:
+            expire_confirmations(now_ts)
+            # Generate a 32-bit token as 8 hex chars, retrying on the rare collision
+            token = f"{secrets.randbits(32):08x}"
+            while token in PENDING_CONFIRMATIONS:
+                token = f"{secrets.randbits(32):08x}"
+            PENDING_CONFIRMATIONS[token] = {
+                "path": data.path,
+                "recursive": data.recursive,
+                "expiry": expiry_ts,
+            }
+            heapq.heappush(EXPIRY_HEAP, (expiry_ts, token))
+            persist_confirmations()
 
         # Return confirmation required response
         # Construct the user-friendly message
@@ -486,7 +1090,7 @@ async def delete_path(data: DeletePathRequest = Body(...)):
         return ConfirmationRequiredResponse(
             message=confirmation_message,
             confirmation_token=token,
-            expires_at=expiry_time,
+            expires_at=datetime.fromtimestamp(expiry_ts, tz=timezone.utc),
         )
 
 
@@ -521,15 +1125,13 @@ async def get_metadata(data: GetMetadataRequest = Body(...)):
     path = normalize_path(data.path)
 
     try:
-        if not path.exists():
-            raise HTTPException(status_code=404, detail=f"Path not found: {data.path}")
-
-        stat_result = path.stat()
+        # One stat call provides existence, type and timestamps
+        stat_result = os.stat(path)
 
         # Determine type
-        if path.is_file():
+        if stat.S_ISREG(stat_result.st_mode):
             file_type = "file"
-        elif path.is_dir():
+        elif stat.S_ISDIR(stat_result.st_mode):
             file_type = "directory"
         else:
             file_type = "other" # Should generally not happen for existing paths normalized
@@ -554,6 +1156,8 @@ async def get_metadata(data: GetMetadataRequest = Body(...)):
         }
         return metadata
 
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail=f"Path not found: {data.path}")
     except PermissionError:
         raise HTTPException(status_code=403, detail=f"Permission denied to access metadata for {data.path}")
     except Exception as e:
@@ -567,33 +1171,30 @@ async def search_content(data: SearchContentRequest = Body(...)):
     """
     base_path = normalize_path(data.path)
     results = []
-    search_query_lower = data.search_query.lower()
 
     if not base_path.is_dir():
         raise HTTPException(status_code=400, detail="Provided path is not a directory")
 
+    rg_results = await ripgrep_search(base_path, data.search_query, data.file_pattern, data.recursive)
+    if rg_results is not None:
+        return ORJSONResponse({"matches": rg_results or ["No matches found"]})
+
     iterator = base_path.rglob(data.file_pattern) if data.recursive else base_path.glob(data.file_pattern)
 
-    for item_path in iterator:
-        if item_path.is_file():
-            try:
-                # Read file line by line to handle potentially large files and different encodings
-                with item_path.open("r", encoding="utf-8", errors="ignore") as f:
-                    for line_num, line in enumerate(f, 1):
-                        if search_query_lower in line.lower():
-                            results.append(
-                                {
-                                    "file_path": str(item_path),
-                                    "line_number": line_num,
-                                    "line_content": line.strip(),
-                                }
-                            )
-            except Exception as e:
-                # Log or handle files that cannot be read (e.g., permission errors, binary files)
-                print(f"Could not read or search file {item_path}: {e}")
-                continue
+    # Collect candidates off the event loop, then scan them concurrently in the
+    # search pool; gather() keeps results in path order, same as ripgrep_search().
+    loop = asyncio.get_running_loop()
+    item_paths = await loop.run_in_executor(SEARCH_EXECUTOR, lambda: sorted(iterator, key=str))
+    semaphore = asyncio.Semaphore(SEARCH_CONCURRENCY)
+
+    async def scan(item_path: pathlib.Path) -> List[Dict]:
+        async with semaphore:
+            return await loop.run_in_executor(SEARCH_EXECUTOR, scan_search_target, item_path, data.search_query)
+
+    for file_matches in await asyncio.gather(*map(scan, item_paths)):
+        results.extend(file_matches)
 
-    return {"matches": results or ["No matches found"]}
+    return ORJSONResponse({"matches": results or ["No matches found"]})
 
 
 @app.get("/list_allowed_directories", summary="List access-permitted directories")
@@ -0,0 +1,27 @@
+import random
+
+import main
+from main import _search_file_text, search_file_content
+
+
+# Line breaks of every style, case variants, and characters whose lowercase is ASCII
+ALPHABET = ["a", "b", "A", "B", "k", "K", "i", "I", " ", "\n", "\r", "\r\n", "K", "İ", "é", "É"]
+QUERIES = ["a", "ab", "BA", "k", "ki", "I", " a", "é", "a\nb", "\r", "b\r\na"]
+
+
+def test_matches_text_scan(tmp_path, monkeypatch):
+    # Tiny chunks so \r\n pairs and line counts straddle chunk seams
+    monkeypatch.setattr(main, "LINE_COUNT_CHUNK_SIZE", 3)
+    rng = random.Random(0)
+    path = tmp_path / "sample.txt"
+    for _ in range(2000):
+        path.write_bytes("".join(rng.choice(ALPHABET) for _ in range(rng.randint(0, 60))).encode())
+        query = rng.choice(QUERIES)
+        assert search_file_content(path, query) == _search_file_text(path, query)
+
+
+def test_matches_text_scan_on_long_lines(tmp_path):
+    path = tmp_path / "sample.txt"
+    path.write_bytes((b"x" * 5000 + b"\r\n" + b"y" * 3000 + b"AB\r" + b"ab\n") * 400)
+    for query in ["ab", "x", "yA"]:
+        assert search_file_content(path, query) == _search_file_text(path, query)
@@ -0,0 +1,75 @@
+import random
+import re
+
+from main import unified_diff
+
+
+HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@$")
+
+
+def split_lines(text):
+    lines = [line + "\n" for line in text.split("\n")]
+    lines[-1] = lines[-1][:-1]
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def apply_unified_diff(original, diff):
+    """Apply a unified diff to original, checking every line it claims to see."""
+    source = split_lines(original)
+    diff_lines = split_lines(diff)
+    if not diff_lines:
+        return original
+    assert diff_lines[0].startswith("--- ") and diff_lines[1].startswith("+++ ")
+
+    result, pos, i = [], 0, 2
+    while i < len(diff_lines):
+        header = HUNK_HEADER.match(diff_lines[i].rstrip("\n"))
+        assert header, f"expected hunk header, got {diff_lines[i]!r}"
+        start, length = int(header.group(1)), int(header.group(2) or 1)
+        start = start - 1 if length else start
+        result.extend(source[pos:start])
+        pos = start
+        i += 1
+        while i < len(diff_lines) and not diff_lines[i].startswith("@@"):
+            tag, line = diff_lines[i][0], diff_lines[i][1:]
+            assert tag in " -+", f"unprefixed diff line {diff_lines[i]!r}"
+            if tag in " -":
+                assert source[pos] == line
+                pos += 1
+            if tag in " +":
+                result.append(line)
+            i += 1
+    result.extend(source[pos:])
+    return "".join(result)
+
+
+def test_random_edits_round_trip():
+    rng = random.Random(0)
+    for _ in range(2000):
+        original = "".join(rng.choice(["x\n", "y\n", "z\n", "w\n"]) for _ in range(rng.randint(0, 40)))
+        lines = split_lines(original)
+        for _ in range(rng.randint(0, 5)):
+            if lines and rng.random() < 0.5:
+                del lines[rng.randrange(len(lines))]
+            else:
+                lines.insert(rng.randint(0, len(lines)), rng.choice(["x\n", "q\n", "r\n"]))
+        modified = "".join(lines)
+        assert apply_unified_diff(original, unified_diff(original, modified, "a", "b")) == modified
+
+
+def test_more_unique_lines_than_diff_match_patch_supports():
+    original = "".join(f"line {i}\n" for i in range(800_000))
+    modified = "first\n" + original[original.index("\n") + 1:original.rindex("line")] + "last\n"
+    diff = unified_diff(original, modified, "a", "b")
+    assert diff.count("@@ -") == 2
+    assert apply_unified_diff(original, diff) == modified
+
+
+def test_more_unique_lines_than_code_points():
+    original = "".join(f"{i}\n" for i in range(1_200_000))
+    # Change the first and last lines so trimming leaves every line in the diff
+    modified = "start\n" + original[2:].replace("\n600000\n", "\n", 1) + "end\n"
+    diff = unified_diff(original, modified, "a", "b")
+    assert apply_unified_diff(original, diff) == modified
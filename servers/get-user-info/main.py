@@ -1,13 +1,15 @@
 
-from fastapi import FastAPI
-from typing import List, Optional
-from pydantic import BaseModel
+from fastapi import FastAPI, Request
+from fastapi.exceptions import RequestValidationError
+from typing import Dict, List, Optional, Set
+from collections import defaultdict
+import msgspec
 import uuid
 
 app = FastAPI()
 
-# Models
-class Company(BaseModel):
+# Models (msgspec structs: decoded and validated in C on the insert hot paths)
+class Company(msgspec.Struct):
     company_name: str
     country: str
     city: str
@@ -15,7 +17,7 @@ class Company(BaseModel):
     description: str
     website: Optional[str] = None
 
-class WTSListing(BaseModel):
+class WTSListing(msgspec.Struct):
     company_id: str
     product_name: str
     quantity: int
@@ -23,8 +25,76 @@ class WTSListing(BaseModel):
     currency: str
     description: Optional[str] = None
 
+class CompanyTable:
+    """
+    In-memory company store laid out as parallel column lists (one entry per
+    company), with a lowercased name column and a trigram index so name
+    searches don't lowercase or scan every stored company on each call.
+    """
+
+    FIELDS = ("company_name", "country", "city", "address", "description", "website")
+
+    def __init__(self):
+        self.ids: List[str] = []
+        self.columns: Dict[str, list] = {field: [] for field in self.FIELDS}
+        self.names_lower: List[str] = []
+        self.trigram_index: Dict[str, Set[int]] = defaultdict(set)
+
+    def insert(self, company_id: str, data: dict):
+        self.insert_many([company_id], [data])
+
+    def insert_many(self, company_ids: List[str], rows: List[dict]):
+        start = len(self.ids)
+        self.ids.extend(company_ids)
+        for field, column in self.columns.items():
+            column.extend([data.get(field) for data in rows])
+        names_lower = [data["company_name"].lower() for data in rows]
+        self.names_lower.extend(names_lower)
+        trigram_index = self.trigram_index
+        for row, name_lower in enumerate(names_lower, start):
+            for i in range(len(name_lower) - 2):
+                trigram_index[name_lower[i:i + 3]].add(row)
+
+    def row(self, row: int) -> dict:
+        return {"id": self.ids[row], **{field: column[row] for field, column in self.columns.items()}}
+
+    def search(self, search_term: str) -> List[dict]:
+        q = search_term.lower()
+        if len(q) < 3:
+            candidates = range(len(self.names_lower))
+        else:
+            # Only names containing every trigram of the query can match
+            postings = sorted(
+                (self.trigram_index.get(q[i:i + 3], set()) for i in range(len(q) - 2)), key=len
+            )
+            candidates = sorted(set.intersection(*postings))
+        names_lower = self.names_lower
+        return [self.row(i) for i in candidates if q in names_lower[i]]
+
+
+def request_body(body_type) -> dict:
+    """OpenAPI requestBody for a msgspec type, so raw-Request endpoints stay documented."""
+    (schema,), components = msgspec.json.schema_components([body_type], ref_template="{name}")
+
+    def inline(node):
+        if isinstance(node, dict):
+            if "$ref" in node:
+                return inline(components[node["$ref"]])
+            return {key: inline(value) for key, value in node.items()}
+        if isinstance(node, list):
+            return [inline(value) for value in node]
+        return node
+
+    return {"requestBody": {"required": True, "content": {"application/json": {"schema": inline(schema)}}}}
+
+async def decode_body(request: Request, body_type):
+    try:
+        return msgspec.json.decode(await request.body(), type=body_type, strict=False)
+    except msgspec.DecodeError as e:  # Also covers msgspec.ValidationError
+        raise RequestValidationError([{"type": "value_error", "loc": ("body",), "msg": str(e)}])
+
 # In-memory "databases"
-companies_db = []
+companies_db = CompanyTable()
 wts_db = []
 
 @app.get("/")
@@ -36,37 +106,35 @@ async def custom_openapi():
     from fastapi.openapi.utils import get_openapi
     return get_openapi(title="GSMAuth API", version="1.0.0", routes=app.routes)
 
-@app.post("/insert_company")
-async def insert_company(company: Company):
+@app.post("/insert_company", openapi_extra=request_body(Company))
+async def insert_company(request: Request):
+    company = await decode_body(request, Company)
     company_id = str(uuid.uuid4())
-    companies_db.append({"id": company_id, **company.dict()})
+    companies_db.insert(company_id, msgspec.structs.asdict(company))
     return {"success": True, "company_id": company_id}
 
-@app.post("/insert_bulk_companies")
-async def insert_bulk_companies(companies: List[Company]):
-    inserted = []
-    for company in companies:
-        company_id = str(uuid.uuid4())
-        companies_db.append({"id": company_id, **company.dict()})
-        inserted.append(company_id)
+@app.post("/insert_bulk_companies", openapi_extra=request_body(List[Company]))
+async def insert_bulk_companies(request: Request):
+    companies = await decode_body(request, List[Company])
+    inserted = [str(uuid.uuid4()) for _ in range(len(companies))]
+    companies_db.insert_many(inserted, [msgspec.structs.asdict(company) for company in companies])
     return {"success": True, "company_ids": inserted}
 
 @app.get("/search_companies")
 async def search_companies(search_term: str):
-    results = [c for c in companies_db if search_term.lower() in c["company_name"].lower()]
+    results = companies_db.search(search_term)
     return {"results": results}
 
-@app.post("/insert_wts")
-async def insert_wts(wts: WTSListing):
+@app.post("/insert_wts", openapi_extra=request_body(WTSListing))
+async def insert_wts(request: Request):
+    wts = await decode_body(request, WTSListing)
     wts_id = str(uuid.uuid4())
-    wts_db.append({"id": wts_id, **wts.dict()})
+    wts_db.append({"id": wts_id, **msgspec.structs.asdict(wts)})
     return {"success": True, "wts_id": wts_id}
 
-@app.post("/insert_bulk_wts")
-async def insert_bulk_wts(wts_list: List[WTSListing]):
-    inserted = []
-    for wts in wts_list:
-        wts_id = str(uuid.uuid4())
-        wts_db.append({"id": wts_id, **wts.dict()})
-        inserted.append(wts_id)
+@app.post("/insert_bulk_wts", openapi_extra=request_body(List[WTSListing]))
+async def insert_bulk_wts(request: Request):
+    wts_list = await decode_body(request, List[WTSListing])
+    inserted = [str(uuid.uuid4()) for _ in range(len(wts_list))]
+    wts_db.extend([{"id": wts_id, **msgspec.structs.asdict(wts)} for wts_id, wts in zip(inserted, wts_list)])
     return {"success": True, "wts_ids": inserted}